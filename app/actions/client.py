@@ -1,14 +1,44 @@
 import logging
 import httpx
-import stamina
+import orjson
+import tenacity
 
 from datetime import datetime, timezone, timedelta
 
 
 logger = logging.getLogger(__name__)
 
-REQUESTED_PROPERTIES = 'unit_id,unit_name,organization_name,real_time_GPS_Time,real_time_status,real_time_Latitude,real_time_Longitude,real_time_Distance,real_time_Speed'
-
+# Galooli returns each DataSet row with one value per requested property, in this order
+GALOOLI_PROPERTIES = (
+    'unit_id',
+    'unit_name',
+    'organization_name',
+    'real_time_GPS_Time',
+    'real_time_status',
+    'real_time_Latitude',
+    'real_time_Longitude',
+    'real_time_Distance',
+    'real_time_Speed',
+)
+REQUESTED_PROPERTIES = ','.join(GALOOLI_PROPERTIES)
+
+# Shared across calls so polls reuse pooled keep-alive connections instead of doing a new TCP+TLS handshake each time
+_CLIENT = httpx.AsyncClient(
+    timeout=120,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+)
+
+# Only the start of response bodies is logged, so big payloads are not copied into log records
+LOG_BODY_MAX_BYTES = 512
+
+# Longest Retry-After hint we are willing to wait for; longer ones fall back to the regular backoff
+RETRY_AFTER_MAX_SECONDS = 32.0
+# Total time a pull may spend waiting between throttled attempts, the same 45s budget stamina's timeout used to give it
+RETRY_WAIT_BUDGET_SECONDS = 45.0
+RETRY_MAX_ATTEMPTS = 10
+
+_RETRY_BACKOFF = tenacity.wait_exponential_jitter(initial=4.0, max=32.0, jitter=5.0)
 
 
 class GalooliGeneralErrorException(Exception):
@@ -28,55 +58,101 @@ class GalooliInvalidUserCredentialsException(Exception):
 
 
 class GalooliTooManyRequestsException(Exception):
-    def __init__(self, error: Exception, message: str, code=1101):
+    def __init__(self, error: Exception, message: str, code=1101, retry_after: float = None):
         self.code = code
         self.message = message
         self.error = error
+        self.retry_after = retry_after
         super().__init__(f"'{self.code}: {self.message}, Error: {self.error}'")
 
 
-@stamina.retry(on=GalooliTooManyRequestsException, wait_initial=4.0, wait_jitter=5.0, wait_max=32.0)
+def _get_retry_after(response):
+    # Only the delay-seconds form of Retry-After is supported, HTTP dates are ignored
+    try:
+        return max(float(response.headers.get("Retry-After")), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _wait_for_retry(retry_state):
+    # Each throttled response gets exactly one wait: its own Retry-After hint when usable, the backoff otherwise
+    retry_after = retry_state.outcome.exception().retry_after
+    if retry_after is not None and retry_after <= RETRY_AFTER_MAX_SECONDS:
+        return retry_after
+    return _RETRY_BACKOFF(retry_state)
+
+
+def _retry_budget_spent(retry_state):
+    # Runs once the next wait is known, so the pull gives up instead of sleeping past its budget
+    return retry_state.idle_for + retry_state.upcoming_sleep > RETRY_WAIT_BUDGET_SECONDS
+
+
+def _log_throttle(retry_state):
+    logger.warning("Galooli throttled the request, retrying in %s seconds", retry_state.upcoming_sleep)
+
+
 async def get_observations(url, *, username: str, password: str, start: datetime):
-    async with httpx.AsyncClient(timeout=120) as session:
-        params = {
-            'requestedPropertiesStr': REQUESTED_PROPERTIES,
-            'lastGMTUpdateTime': start.strftime("%Y-%m-%d %H:%M:%S"),
-            'userName': username,
-            'password': password
-        }
-
-        try:
-            response = await session.get(url, params=params, follow_redirects=True)
-            if response.is_error:
-                logger.error(f"Error 'get_observations'. Response body: {response.text}")
-            response.raise_for_status()
-
-            if parsed_response := response.json():
-                result_code = parsed_response['CommonResult']['ResultCode']
-                if result_code != 0:
-                    result_description = parsed_response['CommonResult'].get('ResultDescription', parsed_response['CommonResult'].get('RejectReason'))
-                    if result_code == 1000:
-                        raise GalooliInvalidUserCredentialsException(
-                            Exception(),
-                            result_description
-                        )
-                    if result_code == 1101:
-                        raise GalooliTooManyRequestsException(
-                            Exception(),
-                            result_description
-                        )
-                    raise GalooliGeneralErrorException(
+    async for attempt in tenacity.AsyncRetrying(
+        retry=tenacity.retry_if_exception_type(GalooliTooManyRequestsException),
+        wait=_wait_for_retry,
+        stop=tenacity.stop_after_attempt(RETRY_MAX_ATTEMPTS) | _retry_budget_spent,
+        before_sleep=_log_throttle,
+        reraise=True
+    ):
+        with attempt:
+            return await _get_observations(url, username=username, password=password, start=start)
+
+
+async def _get_observations(url, *, username: str, password: str, start: datetime):
+    params = {
+        'requestedPropertiesStr': REQUESTED_PROPERTIES,
+        # Same output as strftime("%Y-%m-%d %H:%M:%S"), through the faster ISO formatting path
+        'lastGMTUpdateTime': start.replace(tzinfo=None).isoformat(sep=" ", timespec="seconds"),
+        'userName': username,
+        'password': password
+    }
+
+    try:
+        response = await _CLIENT.get(url, params=params, follow_redirects=True)
+        if response.is_error:
+            logger.error("Error 'get_observations'. Status: %s. Response body: %s", response.status_code, response.content[:LOG_BODY_MAX_BYTES])
+        response.raise_for_status()
+
+        parsed_response = orjson.loads(response.content) if response.content else None
+        if parsed_response:
+            common_result = parsed_response['CommonResult']
+            result_code = common_result['ResultCode']
+            if result_code != 0:
+                result_description = common_result.get('ResultDescription', common_result.get('RejectReason'))
+                if result_code == 1000:
+                    raise GalooliInvalidUserCredentialsException(
                         Exception(),
-                        f"General error occurred. Result code: {result_code}"
+                        result_description
                     )
-
-                return parsed_response
-            else:
-                logger.info(f"Galooli response: {response.text}")
-
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 403:
-                raise GalooliInvalidUserCredentialsException(e, "Unauthorized access", code=403)
-            if e.response.status_code == 404:
-                raise GalooliGeneralErrorException(e, "Not found", code=404)
-            raise e
+                if result_code == 1101:
+                    raise GalooliTooManyRequestsException(
+                        Exception(),
+                        result_description,
+                        retry_after=_get_retry_after(response)
+                    )
+                raise GalooliGeneralErrorException(
+                    Exception(),
+                    f"General error occurred. Result code: {result_code}"
+                )
+
+            return parsed_response
+        else:
+            logger.info("Galooli response: %s", response.content[:LOG_BODY_MAX_BYTES])
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 403:
+            raise GalooliInvalidUserCredentialsException(e, "Unauthorized access", code=403)
+        if e.response.status_code == 404:
+            raise GalooliGeneralErrorException(e, "Not found", code=404)
+        if e.response.status_code == 429:
+            raise GalooliTooManyRequestsException(e, "Too many requests", code=429, retry_after=_get_retry_after(e.response))
+        raise e
+
+
+async def aclose_client():
+    await _CLIENT.aclose()
@@ -1,30 +1,27 @@
+import asyncio
 import httpx
 import logging
-import csv
 import app.actions.client as client
-from dateparser import parse as dp
-from functional import seq
 from datetime import datetime, timedelta, timezone
-import pytz
 
-from io import StringIO
 from app.actions.configurations import AuthenticateConfig, PullObservationsConfig, get_auth_config
-from app.actions.utils import convert_to_gundi_observation, filter_observations_by_device_status
+from app.actions.utils import convert_to_gundi_observation, filter_observations_by_device_status, get_reports_timezone, parse_galooli_time, state_manager
 from app.services.activity_logger import activity_logger
 from app.services.action_scheduler import crontab_schedule
 from app.services.gundi import send_observations_to_gundi
-from app.services.state import IntegrationStateManager
 from app.services.utils import generate_batches
 
 
 logger = logging.getLogger(__name__)
-state_manager = IntegrationStateManager()
 
 GALOOLI_BASE_URL = "https://sdk.galooli-systems.com/galooliSDKService.svc/json/Assets_Report"
+BATCH_SIZE = 200
+# Batches sent to Gundi at the same time. Acquired before a batch is scheduled, so it also bounds the batches held in memory
+MAX_CONCURRENT_BATCHES = 5
 
 
 async def action_auth(integration, action_config: AuthenticateConfig):
-    logger.info(f"Executing 'auth' action with integration ID {integration.id} and action_config {action_config}...")
+    logger.info("Executing 'auth' action with integration ID %s and action_config %s...", integration.id, action_config)
 
     url = integration.base_url or GALOOLI_BASE_URL
 
@@ -48,7 +45,7 @@ async def action_auth(integration, action_config: AuthenticateConfig):
 @crontab_schedule("*/5 * * * *")
 @activity_logger()
 async def action_pull_observations(integration, action_config: PullObservationsConfig):
-    logger.info(f"Executing 'pull_observations' action with integration ID {integration.id} and action_config {action_config}...")
+    logger.info("Executing 'pull_observations' action with integration ID %s and action_config %s...", integration.id, action_config)
 
     url = integration.base_url or GALOOLI_BASE_URL
     auth_config = get_auth_config(integration)
@@ -62,13 +59,13 @@ async def action_pull_observations(integration, action_config: PullObservationsC
 
     if not last_updated_time:
         now = datetime.now(timezone.utc)
-        logger.info(f"Setting initial lookback hours to {action_config.look_back_window_hours} hrs from now")
+        logger.info("Setting initial lookback hours to %s hrs from now", action_config.look_back_window_hours)
         start = now - timedelta(hours=action_config.look_back_window_hours)
     else:
-        start = dp(last_updated_time.get("last_updated_time")).replace(tzinfo=timezone.utc)
+        start = parse_galooli_time(last_updated_time.get("last_updated_time")).replace(tzinfo=timezone.utc)
 
     try:
-        logger.info(f"-- Getting observations for Username: {auth_config.username} from {start} --")
+        logger.info("-- Getting observations for Username: %s from %s --", auth_config.username, start)
         
         if get_observations_response := await client.get_observations(
             url,
@@ -80,31 +77,43 @@ async def action_pull_observations(integration, action_config: PullObservationsC
             dataset = get_observations_response['CommonResult']['DataSet']
             logger.info('%s records received from Galooli', len(dataset))
 
-            # TODO: Figure out why we're converting to CSV first and then posting to Gundi.
-            # Convert dataset to CSV format
-            csv_buffer = StringIO()
-            csv_writer = csv.writer(csv_buffer)
-            csv_writer.writerows(dataset)
-            csv_buffer.seek(0)
-            
-            reports_timezone = pytz.FixedOffset(action_config.gmt_offset * 60)
-            # Apply map and filter operations
-            observations = seq.csv(csv_buffer) \
-                .map(lambda r: convert_to_gundi_observation(r, reports_timezone=reports_timezone, subject_type=action_config.subject_type)) \
-                .filter(lambda x: x is not None) \
-                .to_list()
-            
-            if observations := await filter_observations_by_device_status(str(integration.id), observations):
-                
-                logger.info(f"Extracted {len(observations)} observations for username {auth_config.username}")
-
-                for i, batch in enumerate(generate_batches(observations, 200)):
-                    logger.info(f'Sending observations batch #{i}: {len(batch)} observations. Username: {auth_config.username}')
-                    response = await send_observations_to_gundi(observations=batch, integration_id=integration.id)
-                    observations_extracted += len(response)
+            # Resolve the per-integration settings once instead of on every row
+            reports_timezone = get_reports_timezone(action_config.gmt_offset * 60)
+            subject_type = action_config.subject_type
+            integration_id = str(integration.id)
+            # Stream the converted rows so that only one batch is held in memory at a time
+            observations = (
+                obs for r in dataset
+                if (obs := convert_to_gundi_observation(r, reports_timezone=reports_timezone, subject_type=subject_type)) is not None
+            )
 
+            valid_observations = 0
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+            send_tasks = []
+            try:
+                for i, batch in enumerate(generate_batches(observations, BATCH_SIZE)):
+                    # Batches are cut before device status filtering, so each send carries at most BATCH_SIZE
+                    # observations and can be smaller, or skipped when nothing in the batch changed.
+                    # Filtering stays sequential, so state updates for the same device don't race
+                    if not (batch := await filter_observations_by_device_status(integration_id, batch)):
+                        continue
+                    valid_observations += len(batch)
+                    logger.info('Sending observations batch #%s: %s observations. Username: %s', i, len(batch), auth_config.username)
+                    await semaphore.acquire()
+                    task = asyncio.create_task(send_observations_to_gundi(observations=batch, integration_id=integration.id))
+                    task.add_done_callback(lambda _: semaphore.release())
+                    send_tasks.append(task)
+                responses = await asyncio.gather(*send_tasks)
+            except BaseException:
+                for task in send_tasks:
+                    task.cancel()
+                raise
+            observations_extracted += sum(len(response) for response in responses)
+
+            if valid_observations:
+                logger.info("Extracted %s observations for username %s", valid_observations, auth_config.username)
             else:
-                logger.warning(f"No valid observations found for Username: {auth_config.username}")
+                logger.warning("No valid observations found for Username: %s", auth_config.username)
 
             # Save latest execution time to state
             latest_time = get_observations_response["MaxGmtUpdateTime"]
@@ -115,16 +124,15 @@ async def action_pull_observations(integration, action_config: PullObservationsC
                 action_id="pull_observations",
                 state=state
             )
-            logger.info(f"State updated for integration {integration.id} with last_updated_time: {latest_time}")
+            logger.info("State updated for integration %s with last_updated_time: %s", integration.id, latest_time)
 
             return {"observations_extracted": observations_extracted}
         else:
-            logger.warning(f"No observations found for Username: {auth_config.username}")
+            logger.warning("No observations found for Username: %s", auth_config.username)
             return {"observations_extracted": 0}
     except (client.GalooliInvalidUserCredentialsException, client.GalooliGeneralErrorException, client.GalooliTooManyRequestsException) as e:
-        logger.error(f"Galooli API returned error for integration {integration.id}. Exception: {e}")
+        logger.error("Galooli API returned error for integration %s. Exception: %s", integration.id, e)
         raise
     except httpx.HTTPStatusError as e:
-        message = f"Error while executing 'pull_observations' for integration {integration.id}. Exception: {e}"
-        logger.exception(message)
+        logger.exception("Error while executing 'pull_observations' for integration %s. Exception: %s", integration.id, e)
         raise
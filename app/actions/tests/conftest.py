@@ -1,68 +1,101 @@
+import copy
 import pytest
-from unittest.mock import MagicMock
-from app.actions.configurations import AuthenticateConfig, PullObservationsConfig
+from types import SimpleNamespace
+from unittest.mock import patch
 import pydantic
+from app.actions.client import aclose_client
+
+
+_SAMPLE_GALOOLI_DATASET = (
+    ("sensor1", "Vehicle1", "Model1", "Org1", "extra", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50, 1.2, 100, 90, "Test vehicle"),
+    ("sensor2", "Vehicle2", "Model2", "Org2", "extra", "2023-01-01 11:00:00", "Moving", 40.7589, -73.9851, 200, 60, 1.5, 150, 180, "Test vehicle 2"),
+    ("sensor3", "Vehicle3", "Model3", "Org3", "extra", "2023-01-01 12:00:00", "Stopped", 40.7505, -73.9934, 300, 0, 2.0, 200, 270, "Test vehicle 3")
+)
+
+# SecretStr is immutable, so one instance serves every test
+_SECRET_PW = pydantic.SecretStr("test_password")
+
+_SAMPLE_ER_OBSERVATION = {
+    'manufacturer_id': 'sensor1',
+    'subject_name': 'Vehicle1',
+    'subject_subtype': "security_vehicle",
+    'recorded_at': '2023-01-01T10:00:00-05:00',
+    'location': {
+        'lat': 40.7128,
+        'lon': -74.0060
+    },
+    'additional': {
+        'sensor_id': 'sensor1',
+        'asset_model': 'Model1',
+        'org_name': 'Org1',
+        'status': 'Moving',
+        'distance': 100,
+        'speed': 50,
+        'hdop': 1.2,
+        'altitude': 100,
+        'heading': 90,
+        'description': 'Test vehicle',
+    }
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def close_galooli_client():
+    """Close the shared Galooli HTTP client once the session is done with it"""
+    yield
+    await aclose_client()
+
+
+# The handlers only read attributes off these objects, so plain namespaces do instead of mocks.
+# They are built once per session and each test gets a shallow copy,
+# so attributes a test sets don't leak into the others.
+@pytest.fixture(scope="session")
+def mock_integration_template():
+    return SimpleNamespace(id="test-integration-id", base_url=None, configurations=[])
+
+
+@pytest.fixture(scope="session")
+def mock_auth_config_template():
+    return SimpleNamespace(username="test_user", password=_SECRET_PW)
+
+
+@pytest.fixture(scope="session")
+def mock_pull_config_template():
+    return SimpleNamespace(look_back_window_hours=4, gmt_offset=-5, subject_type="vehicle")
+
 
 @pytest.fixture
-def mock_integration():
+def mock_integration(mock_integration_template):
     """Shared mock integration object"""
-    integration = MagicMock()
-    integration.id = "test-integration-id"
-    integration.base_url = None
-    integration.configurations = []
-    return integration
+    return copy.copy(mock_integration_template)
 
 
 @pytest.fixture
-def mock_auth_config():
+def mock_auth_config(mock_auth_config_template):
     """Shared mock auth config"""
-    auth_config = MagicMock(spec=AuthenticateConfig)
-    auth_config.username = "test_user"
-    auth_config.password = pydantic.SecretStr("test_password")
-    return auth_config
+    return copy.copy(mock_auth_config_template)
 
 
 @pytest.fixture
-def mock_pull_config():
+def mock_pull_config(mock_pull_config_template):
     """Shared mock pull config"""
-    pull_config = MagicMock(spec=PullObservationsConfig)
-    pull_config.look_back_window_hours = 4
-    pull_config.gmt_offset = -5
-    return pull_config
+    return copy.copy(mock_pull_config_template)
+
+
+@pytest.fixture
+def mock_get_observations():
+    """Galooli client's get_observations, patched as seen by the handlers"""
+    with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
+        yield mock_get_obs
 
 
 @pytest.fixture
 def sample_galooli_dataset():
     """Sample Galooli dataset for testing"""
-    return [
-        ["sensor1", "Vehicle1", "Model1", "Org1", "extra", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50, 1.2, 100, 90, "Test vehicle"],
-        ["sensor2", "Vehicle2", "Model2", "Org2", "extra", "2023-01-01 11:00:00", "Moving", 40.7589, -73.9851, 200, 60, 1.5, 150, 180, "Test vehicle 2"],
-        ["sensor3", "Vehicle3", "Model3", "Org3", "extra", "2023-01-01 12:00:00", "Stopped", 40.7505, -73.9934, 300, 0, 2.0, 200, 270, "Test vehicle 3"]
-    ]
+    return [list(row) for row in _SAMPLE_GALOOLI_DATASET]
 
 
 @pytest.fixture
 def sample_er_observation():
     """Sample ER observation for testing"""
-    return {
-        'manufacturer_id': 'sensor1',
-        'subject_name': 'Vehicle1',
-        'subject_subtype': "security_vehicle",
-        'recorded_at': '2023-01-01T10:00:00-05:00',
-        'location': {
-            'lat': 40.7128,
-            'lon': -74.0060
-        },
-        'additional': {
-            'sensor_id': 'sensor1',
-            'asset_model': 'Model1',
-            'org_name': 'Org1',
-            'status': 'Moving',
-            'distance': 100,
-            'speed': 50,
-            'hdop': 1.2,
-            'altitude': 100,
-            'heading': 90,
-            'description': 'Test vehicle',
-        }
-    } 
\ No newline at end of file
+    return copy.deepcopy(_SAMPLE_ER_OBSERVATION)
@@ -1,15 +1,53 @@
 import pytest
 import httpx
-from unittest.mock import AsyncMock, MagicMock, patch
-from datetime import datetime, timezone, timedelta
+import orjson
+from unittest.mock import AsyncMock, patch
+from datetime import datetime, timezone
 
 from app.actions.client import (
+    RETRY_WAIT_BUDGET_SECONDS,
     get_observations,
+    _get_observations,
     GalooliInvalidUserCredentialsException,
     GalooliGeneralErrorException,
     GalooliTooManyRequestsException
 )
 
+_SUCCESS_DATASET = (
+    ('sensor1', 'Vehicle1', 'Model1', 'Org1', 'extra', '2023-01-01 10:00:00', 'Moving', 40.7128, -74.0060, 100, 50, 1.2, 100, 90, 'Test vehicle'),
+    ('sensor2', 'Vehicle2', 'Model2', 'Org2', 'extra', '2023-01-01 11:00:00', 'Moving', 40.7589, -73.9851, 200, 60, 1.5, 150, 180, 'Test vehicle 2')
+)
+
+# Response bodies are encoded once at import and shared by the tests
+_SUCCESS_BODY = orjson.dumps({
+    'MaxGmtUpdateTime': '2025-06-27 01:56:02',
+    'CommonResult': {
+        'ResultCode': 0,
+        'DataSet': _SUCCESS_DATASET
+    }
+})
+
+_TOO_MANY_REQUESTS_BODY = orjson.dumps({
+    'CommonResult': {
+        'ResultCode': 1101,
+        'ResultDescription': 'Too many requests'
+    }
+})
+
+
+
+class _GalooliStub:
+    """Scripted Galooli API served through an httpx.MockTransport"""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(request)
+        # The last scripted response keeps being served, so retry loops see it on every attempt
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
 
 class TestGetObservations:
     """Test cases for get_observations function"""
@@ -24,239 +62,167 @@ class TestGetObservations:
             'start': datetime(2024, 6, 27, 12, 0, 0, tzinfo=timezone.utc)
         }
 
+    @pytest.fixture(scope="session")
+    async def galooli_stub_client(self):
+        """A real httpx client on a mock transport, built once and shared by the tests"""
+        stub = _GalooliStub()
+        client = httpx.AsyncClient(transport=httpx.MockTransport(stub.handler))
+        yield stub, client
+        await client.aclose()
+
     @pytest.fixture
-    def mock_response_success(self):
-        """Mock successful API response"""
-        response = MagicMock()
-        response.is_error = False
-        response.json.return_value = {
-            'MaxGmtUpdateTime': '2025-06-27 01:56:02',
+    def galooli_api(self, monkeypatch, galooli_stub_client):
+        """Galooli API stub, reset for each test and wired in as the client's shared HTTP client"""
+        stub, client = galooli_stub_client
+        stub.responses.clear()
+        stub.requests.clear()
+        monkeypatch.setattr('app.actions.client._CLIENT', client)
+        return stub
+
+    async def test_get_observations_success(self, galooli_api, mock_request_params):
+        """Test successful observation retrieval"""
+        galooli_api.responses.append(httpx.Response(200, content=_SUCCESS_BODY))
+
+        response = await get_observations(**mock_request_params)
+
+        result = response['CommonResult']['DataSet']
+            
+        assert result == [list(row) for row in _SUCCESS_DATASET]
+            
+        # Verify the request parameters
+        assert len(galooli_api.requests) == 1
+        request = galooli_api.requests[0]
+        assert str(request.url.copy_with(query=None)) == "https://test.galooli.com/api"
+        assert request.url.params['userName'] == "test_user"
+        assert request.url.params['password'] == "test_password"
+
+    @pytest.mark.parametrize("result_code,result_description,expected_exception,expected_code,expected_message", [
+        (1000, "Invalid credentials", GalooliInvalidUserCredentialsException, 1000, "Invalid credentials"),
+        (1101, "Too many requests", GalooliTooManyRequestsException, 1101, "Too many requests"),
+        (999, "General error", GalooliGeneralErrorException, -1, "General error occurred"),
+    ])
+    async def test_get_observations_result_code_errors(
+            self, galooli_api, mock_request_params, result_code, result_description,
+            expected_exception, expected_code, expected_message
+    ):
+        """Test that non-zero Galooli result codes raise the matching exception"""
+        galooli_api.responses.append(httpx.Response(200, content=orjson.dumps({
             'CommonResult': {
-                'ResultCode': 0,
-                'DataSet': [
-                    ['sensor1', 'Vehicle1', 'Model1', 'Org1', 'extra', '2023-01-01 10:00:00', 'Moving', 40.7128, -74.0060, 100, 50, 1.2, 100, 90, 'Test vehicle'],
-                    ['sensor2', 'Vehicle2', 'Model2', 'Org2', 'extra', '2023-01-01 11:00:00', 'Moving', 40.7589, -73.9851, 200, 60, 1.5, 150, 180, 'Test vehicle 2']
-                ]
+                'ResultCode': result_code,
+                'ResultDescription': result_description
             }
-        }
-        return response
+        })))
 
-    @pytest.fixture
-    def mock_response_error(self):
-        """Mock error API response"""
-        response = MagicMock()
-        response.is_error = True
-        response.text = "Error response"
-        return response
-
-    @pytest.mark.asyncio
-    async def test_get_observations_success(self, mock_request_params, mock_response_success):
-        """Test successful observation retrieval"""
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response_success
+        with pytest.raises(expected_exception) as exc_info:
+            await get_observations(**mock_request_params)
+
+        assert exc_info.value.code == expected_code
+        assert expected_message in str(exc_info.value)
 
+    async def test_get_observations_too_many_requests_honors_retry_after(self, galooli_api, mock_request_params):
+        """Test that a Retry-After hint is waited for before retrying"""
+        galooli_api.responses.extend([
+            httpx.Response(200, headers={'Retry-After': '0'}, content=_TOO_MANY_REQUESTS_BODY),
+            httpx.Response(200, content=_SUCCESS_BODY),
+        ])
+
+        with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
             response = await get_observations(**mock_request_params)
 
-            result = response['CommonResult']['DataSet']
-            
-            assert result == [
-                ['sensor1', 'Vehicle1', 'Model1', 'Org1', 'extra', '2023-01-01 10:00:00', 'Moving', 40.7128, -74.0060, 100, 50, 1.2, 100, 90, 'Test vehicle'],
-                ['sensor2', 'Vehicle2', 'Model2', 'Org2', 'extra', '2023-01-01 11:00:00', 'Moving', 40.7589, -73.9851, 200, 60, 1.5, 150, 180, 'Test vehicle 2']
-            ]
-            
-            # Verify the request parameters
-            mock_client.get.assert_called_once()
-            call_args = mock_client.get.call_args
-            assert call_args[0][0] == "https://test.galooli.com/api"
-            assert call_args[1]['params']['userName'] == "test_user"
-            assert call_args[1]['params']['password'] == "test_password"
-
-    @pytest.mark.asyncio
-    async def test_get_observations_invalid_credentials(self, mock_request_params):
-        """Test observation retrieval with invalid credentials"""
-        mock_response = MagicMock()
-        mock_response.is_error = False
-        mock_response.json.return_value = {
-            'CommonResult': {
-                'ResultCode': 1000,
-                'ResultDescription': 'Invalid credentials'
-            }
-        }
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response
-            
-            with pytest.raises(GalooliInvalidUserCredentialsException) as exc_info:
-                await get_observations(**mock_request_params)
-            
-            assert exc_info.value.code == 1000
-            assert "Invalid credentials" in str(exc_info.value)
-
-    @pytest.mark.asyncio
-    async def test_get_observations_too_many_requests(self, mock_request_params):
-        """Test observation retrieval with too many requests error"""
-        mock_response = MagicMock()
-        mock_response.is_error = False
-        mock_response.json.return_value = {
-            'CommonResult': {
-                'ResultCode': 1101,
-                'ResultDescription': 'Too many requests'
-            }
-        }
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response
-            
-            with pytest.raises(GalooliTooManyRequestsException) as exc_info:
-                await get_observations(**mock_request_params)
-            
-            assert exc_info.value.code == 1101
-            assert "Too many requests" in str(exc_info.value)
-
-    @pytest.mark.asyncio
-    async def test_get_observations_general_error(self, mock_request_params):
-        """Test observation retrieval with general error"""
-        mock_response = MagicMock()
-        mock_response.is_error = False
-        mock_response.json.return_value = {
-            'CommonResult': {
-                'ResultCode': 999,
-                'ResultDescription': 'General error'
-            }
-        }
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response
-            
-            with pytest.raises(GalooliGeneralErrorException) as exc_info:
-                await get_observations(**mock_request_params)
-            
-            assert exc_info.value.code == -1
-            assert "General error occurred" in str(exc_info.value)
-
-    @pytest.mark.asyncio
-    async def test_get_observations_http_error_403(self, mock_request_params):
-        """Test observation retrieval with HTTP 403 error"""
-        mock_response = MagicMock()
-        mock_response.status_code = 403
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.side_effect = httpx.HTTPStatusError(
-                "Forbidden", request=MagicMock(), response=mock_response
-            )
-            
-            with pytest.raises(GalooliInvalidUserCredentialsException) as exc_info:
-                await get_observations(**mock_request_params)
-            
-            assert exc_info.value.code == 403
-
-    @pytest.mark.asyncio
-    async def test_get_observations_http_error_404(self, mock_request_params):
-        """Test observation retrieval with HTTP 404 error"""
-        mock_response = MagicMock()
-        mock_response.status_code = 404
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.side_effect = httpx.HTTPStatusError(
-                "Not Found", request=MagicMock(), response=mock_response
-            )
-            
-            with pytest.raises(GalooliGeneralErrorException) as exc_info:
-                await get_observations(**mock_request_params)
-            
-            assert exc_info.value.code == 404
-
-    @pytest.mark.asyncio
-    async def test_get_observations_http_error_other(self, mock_request_params):
-        """Test observation retrieval with other HTTP error"""
-        mock_response = MagicMock()
-        mock_response.status_code = 500
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.side_effect = httpx.HTTPStatusError(
-                "Internal Server Error", request=MagicMock(), response=mock_response
-            )
-            
-            with pytest.raises(httpx.HTTPStatusError):
+            assert response['MaxGmtUpdateTime'] == '2025-06-27 01:56:02'
+            assert len(galooli_api.requests) == 2
+            mock_sleep.assert_awaited_once_with(0.0)
+
+    async def test_get_observations_retry_after_on_every_throttle(self, galooli_api, mock_request_params):
+        """Test that a throttle on the retried request is also answered with its own Retry-After hint"""
+        galooli_api.responses.extend([
+            httpx.Response(200, headers={'Retry-After': '0'}, content=_TOO_MANY_REQUESTS_BODY),
+            httpx.Response(429, headers={'Retry-After': '2'}),
+            httpx.Response(200, content=_SUCCESS_BODY),
+        ])
+
+        with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            response = await get_observations(**mock_request_params)
+
+            assert response['MaxGmtUpdateTime'] == '2025-06-27 01:56:02'
+            assert len(galooli_api.requests) == 3
+            assert [c.args for c in mock_sleep.await_args_list] == [(0.0,), (2.0,)]
+
+    async def test_get_observations_retry_after_gives_up_within_budget(self, galooli_api, mock_request_params):
+        """Test that a server that keeps sending Retry-After hints can't hold the pull past the retry budget"""
+        galooli_api.responses.append(httpx.Response(429, headers={'Retry-After': '32'}))
+
+        with patch('asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            with pytest.raises(GalooliTooManyRequestsException):
                 await get_observations(**mock_request_params)
 
-    @pytest.mark.asyncio
-    async def test_get_observations_empty_response(self, mock_request_params, mock_response_success):
+            assert sum(c.args[0] for c in mock_sleep.await_args_list) <= RETRY_WAIT_BUDGET_SECONDS
+            assert [c.args for c in mock_sleep.await_args_list] == [(32.0,)]
+            assert len(galooli_api.requests) == 2
+
+    async def test_get_observations_http_error_429(self, galooli_api, mock_request_params):
+        """Test that HTTP 429 is mapped to the too-many-requests error, carrying the Retry-After hint"""
+        galooli_api.responses.append(httpx.Response(429, headers={'Retry-After': '7'}))
+
+        with pytest.raises(GalooliTooManyRequestsException) as exc_info:
+            await _get_observations(**mock_request_params)
+
+        assert exc_info.value.code == 429
+        assert exc_info.value.retry_after == 7.0
+
+    @pytest.mark.parametrize("status_code,expected_exception,expected_code", [
+        (403, GalooliInvalidUserCredentialsException, 403),
+        (404, GalooliGeneralErrorException, 404),
+        (500, httpx.HTTPStatusError, None),
+    ])
+    async def test_get_observations_http_errors(
+            self, galooli_api, mock_request_params, status_code, expected_exception, expected_code
+    ):
+        """Test that HTTP error statuses are mapped to the matching exception"""
+        galooli_api.responses.append(httpx.Response(status_code))
+
+        with pytest.raises(expected_exception) as exc_info:
+            await get_observations(**mock_request_params)
+
+        if expected_code is not None:
+            assert exc_info.value.code == expected_code
+
+    async def test_get_observations_empty_response(self, galooli_api, mock_request_params):
         """Test observation retrieval with empty response"""
-        mock_response_success.json.return_value = None
-        
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response_success
+        galooli_api.responses.append(httpx.Response(200, content=b""))
             
-            result = await get_observations(**mock_request_params)
+        result = await get_observations(**mock_request_params)
             
-            assert result is None
+        assert result is None
 
-    @pytest.mark.asyncio
-    async def test_get_observations_request_parameters(self, mock_request_params, mock_response_success):
+    async def test_get_observations_request_parameters(self, galooli_api, mock_request_params):
         """Test that request parameters are correctly set"""
-        with patch('httpx.AsyncClient') as mock_client_class:
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response_success
-            
-            await get_observations(**mock_request_params)
-            
-            # Verify the request was made with correct parameters
-            mock_client.get.assert_called_once()
-            call_args = mock_client.get.call_args
+        galooli_api.responses.append(httpx.Response(200, content=_SUCCESS_BODY))
             
-            # Check URL
-            assert call_args[0][0] == "https://test.galooli.com/api"
+        await get_observations(**mock_request_params)
             
-            # Check parameters
-            params = call_args[1]['params']
-            assert params['userName'] == "test_user"
-            assert params['password'] == "test_password"
-            assert 'requestedPropertiesStr' in params
-            assert 'lastGMTUpdateTime' in params
+        # Verify the request was made with correct parameters
+        assert len(galooli_api.requests) == 1
+        request = galooli_api.requests[0]
             
-            # Check that follow_redirects is True
-            assert call_args[1]['follow_redirects'] is True
-
-    @pytest.mark.skip("Needs refactor")
-    @pytest.mark.asyncio
-    async def test_get_observations_time_window_calculation(self, mock_request_params, mock_response_success):
-        """Test that the time window is calculated correctly"""
-        with patch('httpx.AsyncClient') as mock_client_class, \
-             patch('app.actions.client.datetime') as mock_datetime:
+        # Check URL
+        assert str(request.url.copy_with(query=None)) == "https://test.galooli.com/api"
             
-            # Mock current time
-            mock_now = datetime(2023, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
-            mock_datetime.now.return_value = mock_now
-            mock_datetime.strftime = datetime.strftime
-            
-            mock_client = AsyncMock()
-            mock_client_class.return_value.__aenter__.return_value = mock_client
-            mock_client.get.return_value = mock_response_success
-            
-            await get_observations(**mock_request_params)
-            
-            # Verify the time window calculation
-            expected_start_time = mock_now - timedelta(hours=3)
-            expected_time_str = expected_start_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-            call_args = mock_client.get.call_args
-            params = call_args[1]['params']
-            assert params['lastGMTUpdateTime'] == expected_time_str
+        # Check parameters
+        params = request.url.params
+        assert params['userName'] == "test_user"
+        assert params['password'] == "test_password"
+        assert 'requestedPropertiesStr' in params
+        assert params['lastGMTUpdateTime'] == "2024-06-27 12:00:00"
+
+    async def test_get_observations_follows_redirects(self, galooli_api, mock_request_params):
+        """Test that redirects from the Galooli API are followed"""
+        galooli_api.responses.extend([
+            httpx.Response(302, headers={'Location': "https://test.galooli.com/api/v2"}),
+            httpx.Response(200, content=_SUCCESS_BODY),
+        ])
+
+        response = await get_observations(**mock_request_params)
+
+        assert response['MaxGmtUpdateTime'] == '2025-06-27 01:56:02'
+        assert [r.url.path for r in galooli_api.requests] == ["/api", "/api/v2"]
@@ -1,12 +1,10 @@
 import pytest
+from types import SimpleNamespace
 import httpx
-from unittest.mock import AsyncMock, MagicMock, patch
-from io import StringIO
-import pytz
-import pydantic
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
 
 from app.actions.handlers import action_auth, action_pull_observations
-from app.actions.configurations import AuthenticateConfig, PullObservationsConfig
 from app.actions.client import (
     GalooliInvalidUserCredentialsException,
     GalooliGeneralErrorException,
@@ -14,112 +12,107 @@ from app.actions.client import (
 )
 
 
-class TestActionAuth:
-    """Test cases for action_auth function"""
+# Galooli rows are built once at import; tests only ever read them
+_SAMPLE_ROW = ("sensor1", "Vehicle1", "Org1", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50)
+_SAMPLE_ROW2 = ("sensor2", "Vehicle2", "Org2", "2023-01-01 11:00:00", "Moving", 40.7589, -73.9851, 200, 60)
+_NO_STATUS_ROW = ("sensor1", "Vehicle1", "Org1", "2023-01-01 10:00:00", None, 40.7128, -74.0060, 100, 50)
+_BAD_ROW = (None, "Vehicle1", "Org1", "2023-01-01 10:00:00", "Stopped", 40.7128, -74.0060, 100, 50)
+_SAMPLE_DATASET = (_SAMPLE_ROW, _SAMPLE_ROW2)
 
-    @pytest.fixture
-    def mock_integration(self):
-        """Mock integration object"""
-        integration = MagicMock()
-        integration.id = "test-integration-id"
-        integration.base_url = None
-        return integration
+# The handlers only read the status code off a failed response
+_DUMMY_REQUEST = httpx.Request("GET", "https://example.invalid/")
+_RESPONSE_500 = SimpleNamespace(status_code=500)
 
-    @pytest.fixture
-    def mock_action_config(self):
-        """Mock AuthenticateConfig"""
-        config = MagicMock(spec=AuthenticateConfig)
-        config.username = "test_user"
-        config.password = pydantic.SecretStr("test_password")
-        return config
 
+def _dataset_response(dataset):
+    """Wrap dataset rows in a Galooli CommonResult payload"""
+    return {
+        "MaxGmtUpdateTime": "2025-06-27 01:56:02",
+        "CommonResult": {
+            "ResultDescription": "",
+            "ResultCode": 0,
+            "RejectReason": "",
+            "DataSet": list(dataset)
+        }
+    }
+
+
+class TestActionAuth:
+    """Test cases for action_auth function"""
 
-    @pytest.mark.asyncio
-    async def test_action_auth_success(self, mock_integration, mock_action_config):
+    async def test_action_auth_success(self, caplog, mock_integration, mock_auth_config, mock_get_observations):
         """Test successful authentication"""
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.return_value = [["data1"], ["data2"]]
+        mock_get_observations.return_value = [["data1"], ["data2"]]
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {"valid_credentials": True}
-            mock_get_obs.assert_called_once()
+        assert result == {"valid_credentials": True}
+        mock_get_observations.assert_called_once()
+        assert "Executing 'auth' action with integration ID test-integration-id" in caplog.text
 
-    @pytest.mark.asyncio
-    async def test_action_auth_with_custom_base_url(self, mock_integration, mock_action_config):
+    async def test_action_auth_with_custom_base_url(self, mock_integration, mock_auth_config, mock_get_observations):
         """Test authentication with custom base URL"""
         a_custom_url = "https://something-special.com/api"
         mock_integration.base_url = a_custom_url
         
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.return_value = [["data1"]]
+        mock_get_observations.return_value = [["data1"]]
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {"valid_credentials": True}
-            mock_get_obs.assert_called_once()
+        assert result == {"valid_credentials": True}
+        mock_get_observations.assert_called_once()
 
-    @pytest.mark.asyncio
-    async def test_action_auth_invalid_credentials(self, mock_integration, mock_action_config):
+    async def test_action_auth_invalid_credentials(self, mock_integration, mock_auth_config, mock_get_observations):
         """Test authentication with invalid credentials"""
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.side_effect = GalooliInvalidUserCredentialsException(
-                Exception(), "Invalid credentials", 1000
-            )
+        mock_get_observations.side_effect = GalooliInvalidUserCredentialsException(
+            Exception(), "Invalid credentials", 1000
+        )
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {
-                "valid_credentials": False,
-                "message": "Invalid credentials",
-                "code": 1000
-            }
-
-    @pytest.mark.asyncio
-    async def test_action_auth_general_error(self, mock_integration, mock_action_config):
+        assert result == {
+            "valid_credentials": False,
+            "message": "Invalid credentials",
+            "code": 1000
+        }
+
+    async def test_action_auth_general_error(self, mock_integration, mock_auth_config, mock_get_observations):
         """Test authentication with general error"""
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.side_effect = GalooliGeneralErrorException(
-                Exception(), "General error", -1
-            )
+        mock_get_observations.side_effect = GalooliGeneralErrorException(
+            Exception(), "General error", -1
+        )
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {
-                "valid_credentials": False,
-                "message": "General error",
-                "code": -1
-            }
-
-    @pytest.mark.asyncio
-    async def test_action_auth_too_many_requests(self, mock_integration, mock_action_config):
+        assert result == {
+            "valid_credentials": False,
+            "message": "General error",
+            "code": -1
+        }
+
+    async def test_action_auth_too_many_requests(self, mock_integration, mock_auth_config, mock_get_observations):
         """Test authentication with too many requests error"""
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.side_effect = GalooliTooManyRequestsException(
-                Exception(), "Too many requests", 1101
-            )
+        mock_get_observations.side_effect = GalooliTooManyRequestsException(
+            Exception(), "Too many requests", 1101
+        )
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {
-                "valid_credentials": False,
-                "message": "Too many requests",
-                "code": 1101
-            }
-
-    @pytest.mark.asyncio
-    async def test_action_auth_http_error(self, mock_integration, mock_action_config):
+        assert result == {
+            "valid_credentials": False,
+            "message": "Too many requests",
+            "code": 1101
+        }
+
+    async def test_action_auth_http_error(self, mock_integration, mock_auth_config, mock_get_observations):
         """Test authentication with HTTP error"""
-        with patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_response = MagicMock()
-            mock_response.status_code = 500
-            mock_get_obs.side_effect = httpx.HTTPStatusError(
-                "Server error", request=MagicMock(), response=mock_response
-            )
+        mock_get_observations.side_effect = httpx.HTTPStatusError(
+            "Server error", request=_DUMMY_REQUEST, response=_RESPONSE_500
+        )
             
-            result = await action_auth(mock_integration, mock_action_config)
+        result = await action_auth(mock_integration, mock_auth_config)
             
-            assert result == {"error": True, "status_code": 500}
+        assert result == {"error": True, "status_code": 500}
 
 
 @patch('app.services.activity_logger.publish_event', AsyncMock())
@@ -129,253 +122,176 @@ class TestActionPullObservations:
     @pytest.fixture
     def mock_dataset_response(self):
         """Mock dataset response"""
-        return {
-            "MaxGmtUpdateTime": "2025-06-27 01:56:02",
-            "CommonResult": {
-                "ResultDescription": "",
-                "ResultCode": 0,
-                "RejectReason": "",
-                "DataSet": [
-                    ["sensor1", "Vehicle1", "Org1", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50,],
-                    ["sensor2", "Vehicle2", "Org2", "2023-01-01 11:00:00", "Moving", 40.7589, -73.9851, 200, 60]
-                ]
-            }
-        }
+        return _dataset_response(_SAMPLE_DATASET)
 
     @pytest.fixture
     def mock_empty_dataset_response(self):
         """Mock dataset response"""
-        return {
-            "MaxGmtUpdateTime": "2025-06-27 01:56:02",
-            "CommonResult": {
-                "ResultDescription": "",
-                "ResultCode": 0,
-                "RejectReason": "",
-                "DataSet": []
-            }
-        }
+        return _dataset_response(())
 
     @pytest.fixture
     def mock_dataset_bad_observation_response(self):
         """Mock dataset response"""
-        return {
-            "MaxGmtUpdateTime": "2025-06-27 01:56:02",
-            "CommonResult": {
-                "ResultDescription": "",
-                "ResultCode": 0,
-                "RejectReason": "",
-                "DataSet": [
-                    [None, "Vehicle1", "Org1", "2023-01-01 10:00:00", "Stopped", 40.7128, -74.0060, 100, 50]
-                ]
-            }
-        }
-
-    @pytest.fixture
-    def mock_integration(self):
-        """Mock integration object"""
-        integration = MagicMock()
-        integration.id = "test-integration-id"
-        integration.base_url = None
-        return integration
+        return _dataset_response((_BAD_ROW,))
 
-    @pytest.fixture
-    def mock_action_config(self):
-        """Mock PullObservationsConfig"""
-        config = MagicMock(spec=PullObservationsConfig)
-        config.look_back_window_hours = 4
-        config.gmt_offset = -5
-        config.subject_type = "vehicle"
-        return config
-
-    @pytest.fixture
-    def mock_auth_config(self):
-        """Mock auth config"""
-        auth_config = MagicMock()
-        auth_config.username = "test_user"
-        auth_config.password.get_secret_value.return_value = "test_password"
-        return auth_config
-    
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_success(self, mock_integration, mock_action_config, mock_auth_config, mock_dataset_response):
+    async def test_action_pull_observations_success(self, caplog, mock_integration, mock_pull_config, mock_auth_config, mock_dataset_response, mock_get_observations):
         """Test successful pull observations"""
+        mock_get_observations.return_value = mock_dataset_response
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_dataset_response), \
              patch('app.actions.handlers.state_manager.set_state', return_value={}), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}), \
-             patch('app.actions.utils.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.get_state', return_value={}), \
+             patch('app.actions.utils.state_manager.set_states_bulk', return_value=None), \
+             patch('app.actions.utils.state_manager.get_states_bulk', return_value={}), \
              patch('app.actions.handlers.send_observations_to_gundi', return_value=["obs1", "obs2"]) as mock_send:
             
-            result = await action_pull_observations(mock_integration, mock_action_config)
+            result = await action_pull_observations(mock_integration, mock_pull_config)
             
             assert result == {"observations_extracted": 2}
             mock_send.assert_called_once()
+            assert "Executing 'pull_observations' action with integration ID test-integration-id" in caplog.text
+            assert "Getting observations for Username: test_user" in caplog.text
 
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_no_dataset(self, mock_integration, mock_action_config, mock_auth_config, mock_empty_dataset_response):
+    async def test_action_pull_observations_no_dataset(self, mock_integration, mock_pull_config, mock_auth_config, mock_empty_dataset_response, mock_get_observations):
         """Test pull observations with no dataset returned"""
+        mock_get_observations.return_value = mock_empty_dataset_response
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_empty_dataset_response), \
              patch('app.actions.handlers.state_manager.set_state', return_value={}), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}):
             
-            result = await action_pull_observations(mock_integration, mock_action_config)
+            result = await action_pull_observations(mock_integration, mock_pull_config)
             
             assert result == {"observations_extracted": 0}
 
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_no_valid_observations(self, mock_integration, mock_action_config, mock_auth_config, mock_dataset_bad_observation_response):
+    async def test_action_pull_observations_no_valid_observations(self, mock_integration, mock_pull_config, mock_auth_config, mock_dataset_bad_observation_response, mock_get_observations):
         """Test pull observations with dataset but no valid observations after processing"""
+        mock_get_observations.return_value = mock_dataset_bad_observation_response
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_dataset_bad_observation_response), \
              patch('app.actions.handlers.state_manager.set_state', return_value={}), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}):
             
-            result = await action_pull_observations(mock_integration, mock_action_config)
+            result = await action_pull_observations(mock_integration, mock_pull_config)
             
             assert result == {"observations_extracted": 0}
 
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_with_custom_base_url(self, mock_integration, mock_action_config, mock_auth_config, mock_dataset_response):
+    async def test_action_pull_observations_with_custom_base_url(self, mock_integration, mock_pull_config, mock_auth_config, mock_dataset_response, mock_get_observations):
         """Test pull observations with custom base URL"""
         mock_integration.base_url = "https://custom.galooli.com/api"
 
+        mock_get_observations.return_value = mock_dataset_response
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_dataset_response) as mock_get_obs, \
              patch('app.actions.handlers.state_manager.get_state', return_value={}), \
              patch('app.actions.handlers.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.get_state', return_value={}), \
+             patch('app.actions.utils.state_manager.set_states_bulk', return_value=None), \
+             patch('app.actions.utils.state_manager.get_states_bulk', return_value={}), \
              patch('app.actions.handlers.send_observations_to_gundi', return_value=["obs1", "obs2"]) as mock_send:
             
-            result = await action_pull_observations(mock_integration, mock_action_config)
+            result = await action_pull_observations(mock_integration, mock_pull_config)
             
             assert result == {"observations_extracted": 2}
-            mock_get_obs.assert_called_once_with(
+            mock_get_observations.assert_called_once_with(
                 "https://custom.galooli.com/api",
                 username="test_user",
                 password="test_password",
-                start=mock_get_obs.call_args[1]["start"]
+                start=mock_get_observations.call_args[1]["start"]
             )
             mock_send.assert_called_once()
 
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_client_exception(self, mock_integration, mock_action_config, mock_auth_config):
-        """Test pull observations with client exception"""
+    async def test_action_pull_observations_null_status(self, mock_integration, mock_pull_config, mock_auth_config, mock_get_observations):
+        """Test that a row with a null status is still sent"""
+        mock_get_observations.return_value = _dataset_response((_NO_STATUS_ROW,))
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
+             patch('app.actions.handlers.state_manager.set_state', return_value={}), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}), \
-             patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_get_obs.side_effect = GalooliInvalidUserCredentialsException(
+             patch('app.actions.utils.state_manager.set_states_bulk', return_value=None), \
+             patch('app.actions.utils.state_manager.get_states_bulk', return_value={}), \
+             patch('app.actions.handlers.send_observations_to_gundi', side_effect=lambda observations, integration_id: observations) as mock_send:
+
+            result = await action_pull_observations(mock_integration, mock_pull_config)
+
+            assert result == {"observations_extracted": 1}
+            assert mock_send.call_args.kwargs["observations"][0]["additional"]["status"] is None
+
+    async def test_action_pull_observations_look_back_window(self, mock_integration, mock_pull_config, mock_auth_config, mock_empty_dataset_response, mock_get_observations):
+        """Test that without a saved state the pull starts look_back_window_hours before now"""
+        mock_pull_config.look_back_window_hours = 3
+        mock_get_observations.return_value = mock_empty_dataset_response
+        with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
+             patch('app.actions.handlers.state_manager.set_state', return_value={}), \
+             patch('app.actions.handlers.state_manager.get_state', return_value={}):
+
+            before = datetime.now(timezone.utc)
+            await action_pull_observations(mock_integration, mock_pull_config)
+            after = datetime.now(timezone.utc)
+
+            start = mock_get_observations.call_args.kwargs["start"]
+            assert before - timedelta(hours=3) <= start <= after - timedelta(hours=3)
+
+    async def test_action_pull_observations_resumes_from_saved_state(self, mock_integration, mock_pull_config, mock_auth_config, mock_empty_dataset_response, mock_get_observations):
+        """Test that the pull starts from the last update time saved in the integration state"""
+        mock_get_observations.return_value = mock_empty_dataset_response
+        with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
+             patch('app.actions.handlers.state_manager.set_state', return_value={}), \
+             patch('app.actions.handlers.state_manager.get_state', return_value={"last_updated_time": "2025-06-27 01:56:02"}):
+
+            await action_pull_observations(mock_integration, mock_pull_config)
+
+            assert mock_get_observations.call_args.kwargs["start"] == datetime(2025, 6, 27, 1, 56, 2, tzinfo=timezone.utc)
+
+    async def test_action_pull_observations_client_exception(self, mock_integration, mock_pull_config, mock_auth_config, mock_get_observations):
+        """Test pull observations with client exception"""
+        with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
+             patch('app.actions.handlers.state_manager.get_state', return_value={}):
+            mock_get_observations.side_effect = GalooliInvalidUserCredentialsException(
                 Exception(), "Invalid credentials", 1000
             )
             
             with pytest.raises(GalooliInvalidUserCredentialsException):
-                await action_pull_observations(mock_integration, mock_action_config)
+                await action_pull_observations(mock_integration, mock_pull_config)
 
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_http_error(self, mock_integration, mock_action_config, mock_auth_config):
+    async def test_action_pull_observations_http_error(self, mock_integration, mock_pull_config, mock_auth_config, mock_get_observations):
         """Test pull observations with HTTP error"""
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.state_manager.get_state', return_value={}), \
-             patch('app.actions.handlers.client.get_observations') as mock_get_obs:
-            mock_response = MagicMock()
-            mock_response.status_code = 500
-            mock_get_obs.side_effect = httpx.HTTPStatusError(
-                "Server error", request=MagicMock(), response=mock_response
+             patch('app.actions.handlers.state_manager.get_state', return_value={}):
+            mock_get_observations.side_effect = httpx.HTTPStatusError(
+                "Server error", request=_DUMMY_REQUEST, response=_RESPONSE_500
             )
             
             with pytest.raises(httpx.HTTPStatusError):
-                await action_pull_observations(mock_integration, mock_action_config)
-
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_batch_processing(self, mock_integration, mock_action_config, mock_auth_config):
-        """Test pull observations with batch processing"""
-        # Create a large dataset to test batching
-        mock_dataset_response = {
-            "MaxGmtUpdateTime": "2025-06-27 01:56:02",
-            "CommonResult": {
-                "ResultDescription": "",
-                "ResultCode": 0,
-                "RejectReason": "",
-                "DataSet": [
-                    ["sensor1", "Vehicle1", "Org1", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50],
-                ] * 250 # 250 observations to ensure batching
-            }
-        }
-        
+                await action_pull_observations(mock_integration, mock_pull_config)
+
+    async def test_action_pull_observations_send_error(self, mock_integration, mock_pull_config, mock_auth_config, mock_dataset_response, mock_get_observations):
+        """Test that a failure sending a batch to Gundi is raised and the state is not updated"""
+        mock_get_observations.return_value = mock_dataset_response
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_dataset_response), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}), \
-             patch('app.actions.handlers.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.get_state', return_value={}), \
-             patch('app.actions.handlers.send_observations_to_gundi', return_value=["obs"] * 200) as mock_send:
-            
-            result = await action_pull_observations(mock_integration, mock_action_config)
-            
-            # Should have 2 batches: 200 + 50 observations
-            assert mock_send.call_count == 2
-            assert result == {"observations_extracted": 400}  # 200 * 2 batches
-
-@patch('app.services.activity_logger.publish_event', AsyncMock())
-class TestHandlersIntegration:
-    """Integration tests for handlers"""
-
-    @pytest.mark.asyncio
-    async def test_action_auth_logging(self, caplog):
-        """Test that action_auth logs appropriately"""
-        mock_integration = MagicMock()
-        mock_integration.id = "test-id"
-        mock_integration.base_url = None
-        
-        mock_config = MagicMock(spec=AuthenticateConfig)
-        mock_config.username = "test_user"
-        mock_config.password = pydantic.SecretStr("test_password")
-        
-        with patch('app.actions.handlers.client.get_observations', return_value=[["data"]]):
-            await action_auth(mock_integration, mock_config)
-            
-            assert "Executing 'auth' action with integration ID test-id" in caplog.text
-
-    @pytest.mark.asyncio
-    async def test_action_pull_observations_logging(self, caplog):
-        """Test that action_pull_observations logs appropriately"""
-
-        mock_dataset_response = {
-            "MaxGmtUpdateTime": "2025-06-27 01:56:02",
-            "CommonResult": {
-                "ResultDescription": "",
-                "ResultCode": 0,
-                "RejectReason": "",
-                "DataSet": [
-                    ["sensor1", "Vehicle1", "Org1", "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 100, 50, ],
-                    ["sensor2", "Vehicle2", "Org2", "2023-01-01 11:00:00", "Moving", 40.7589, -73.9851, 200, 60]
-                ]
-            }
-        }
-
-        mock_integration = MagicMock()
-        mock_integration.id = "test-id"
-        mock_integration.base_url = None
-        
-        mock_action_config = MagicMock(spec=PullObservationsConfig)
-        mock_action_config.look_back_window_hours = 4
-        mock_action_config.gmt_offset = -5
-        mock_action_config.subject_type = "vehicle"
-        
-        mock_auth_config = MagicMock()
-        mock_auth_config.username = "test_user"
-        mock_auth_config.password.get_secret_value.return_value = "test_password"
-
+             patch('app.actions.handlers.state_manager.set_state', return_value={}) as mock_set_state, \
+             patch('app.actions.utils.state_manager.set_states_bulk', return_value=None), \
+             patch('app.actions.utils.state_manager.get_states_bulk', return_value={}), \
+             patch('app.actions.handlers.send_observations_to_gundi', side_effect=httpx.ConnectError("Connection refused")):
+
+            with pytest.raises(httpx.ConnectError):
+                await action_pull_observations(mock_integration, mock_pull_config)
+
+            mock_set_state.assert_not_called()
+
+    @pytest.mark.parametrize("n_rows,expected_batch_sizes", [
+        (1, [1]),
+        (2, [2]),
+        (3, [2, 1]),
+    ])
+    async def test_action_pull_observations_batch_processing(self, monkeypatch, mock_integration, mock_pull_config, mock_auth_config, mock_get_observations, n_rows, expected_batch_sizes):
+        """Test pull observations with batch processing, just below, at and above the batch size"""
+        # Shrink the batch size so a few rows are enough to reach the batch boundary
+        monkeypatch.setattr('app.actions.handlers.BATCH_SIZE', 2)
+        mock_get_observations.return_value = _dataset_response([_SAMPLE_ROW] * n_rows)
         with patch('app.actions.handlers.get_auth_config', return_value=mock_auth_config), \
-             patch('app.actions.handlers.client.get_observations', return_value=mock_dataset_response), \
              patch('app.actions.handlers.state_manager.get_state', return_value={}), \
              patch('app.actions.handlers.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.set_state', return_value={}), \
-             patch('app.actions.utils.state_manager.get_state', return_value={}), \
-             patch('app.actions.handlers.send_observations_to_gundi', return_value=["obs1"]):
+             patch('app.actions.utils.state_manager.set_states_bulk', return_value=None), \
+             patch('app.actions.utils.state_manager.get_states_bulk', return_value={}), \
+             patch('app.actions.handlers.send_observations_to_gundi', side_effect=lambda observations, integration_id: observations) as mock_send:
             
-            await action_pull_observations(mock_integration, mock_action_config)
+            result = await action_pull_observations(mock_integration, mock_pull_config)
             
-            assert "Executing 'pull_observations' action with integration ID test-id" in caplog.text
-            assert "Getting observations for Username: test_user" in caplog.text 
\ No newline at end of file
+            assert [len(c.kwargs["observations"]) for c in mock_send.call_args_list] == expected_batch_sizes
+            assert result == {"observations_extracted": n_rows}
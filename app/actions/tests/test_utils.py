@@ -1,6 +1,7 @@
 import pytest
-import pytz
-from app.actions.utils import convert_to_gundi_observation
+from datetime import timedelta, timezone
+from unittest.mock import patch
+from app.actions.utils import convert_to_gundi_observation, filter_observations_by_device_status, format_recorded_at, get_reports_timezone
 
 
 class TestConvertToGundiObservation:
@@ -9,7 +10,7 @@ class TestConvertToGundiObservation:
     @pytest.fixture
     def reports_timezone(self):
         """Mock timezone for testing"""
-        return pytz.FixedOffset(-300)  # EST timezone
+        return timezone(timedelta(minutes=-300))  # EST timezone
 
     def test_convert_to_gundi_observation_success(self, reports_timezone):
         """Test successful conversion of Galooli record to Gundi observation"""
@@ -81,6 +82,18 @@ class TestConvertToGundiObservation:
         with pytest.raises(ValueError):
             convert_to_gundi_observation(galooli_record, reports_timezone=reports_timezone)
 
+    def test_convert_to_er_observation_extra_trailing_fields(self, reports_timezone):
+        """Test that fields beyond the requested properties are ignored"""
+        galooli_record = [
+            "sensor1", "Vehicle1", "Org1",
+            "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060,
+            100, 50, "unexpected"
+        ]
+        result = convert_to_gundi_observation(galooli_record, reports_timezone=reports_timezone)
+
+        assert result is not None
+        assert result['additional']['speed'] == 50
+
     def test_convert_to_er_observation_zero_coordinates(self, reports_timezone):
         """Test conversion with zero coordinates (should return None)"""
         galooli_record = [
@@ -125,7 +138,7 @@ class TestConvertToGundiObservation:
     def test_convert_to_er_observation_timezone_handling(self):
         """Test timezone handling in conversion"""
         # Test with UTC timezone
-        utc_timezone = pytz.FixedOffset(0)
+        utc_timezone = timezone.utc
         galooli_record = [
             "sensor1", "Vehicle1", "Org1",
             "2023-01-01 10:00:00", "Moving", 40.7128, -74.0060, 
@@ -148,3 +161,109 @@ class TestConvertToGundiObservation:
         assert result is not None
         assert result['additional']['distance'] == 123.45
         assert result['additional']['speed'] == 67.89
+
+    def test_convert_to_er_observation_fractional_seconds(self, reports_timezone):
+        """Test conversion of a GPS time carrying fractional seconds"""
+        galooli_record = [
+            "sensor1", "Vehicle1", "Org1",
+            "2023-01-01 10:00:00.250", "Moving", 40.7128, -74.0060,
+            100, 50
+        ]
+        result = convert_to_gundi_observation(galooli_record, reports_timezone=reports_timezone)
+
+        assert result is not None
+        assert result['recorded_at'] == "2023-01-01T10:00:00.250000-05:00"
+
+    def test_convert_to_er_observation_non_iso_time(self, reports_timezone):
+        """Test that a GPS time fromisoformat can't read is still parsed"""
+        galooli_record = [
+            "sensor1", "Vehicle1", "Org1",
+            "2023/01/01 10:00:00", "Moving", 40.7128, -74.0060,
+            100, 50
+        ]
+        result = convert_to_gundi_observation(galooli_record, reports_timezone=reports_timezone)
+
+        assert result is not None
+        assert result['recorded_at'] == "2023-01-01T10:00:00-05:00"
+
+    def test_convert_to_er_observation_unparseable_time(self, reports_timezone):
+        """Test that a GPS time no parser understands raises ValueError"""
+        galooli_record = [
+            "sensor1", "Vehicle1", "Org1",
+            "not a time", "Moving", 40.7128, -74.0060,
+            100, 50
+        ]
+        with pytest.raises(ValueError):
+            convert_to_gundi_observation(galooli_record, reports_timezone=reports_timezone)
+
+
+class TestGetReportsTimezone:
+    """Test cases for get_reports_timezone function"""
+
+    def test_get_reports_timezone_offset(self):
+        """Test that the timezone carries the configured offset and is reused"""
+        tz = get_reports_timezone(-300)
+
+        assert tz.utcoffset(None) == timedelta(hours=-5)
+        assert get_reports_timezone(-300) is tz
+
+
+class TestFormatRecordedAt:
+    """Test cases for format_recorded_at function"""
+
+    def test_format_recorded_at_is_keyed_by_timezone(self):
+        """Test that the cached value is not shared between timezones"""
+        assert format_recorded_at("2023-01-01 10:00:00", get_reports_timezone(-300)) == "2023-01-01T10:00:00-05:00"
+        assert format_recorded_at("2023-01-01 10:00:00", get_reports_timezone(60)) == "2023-01-01T10:00:00+01:00"
+
+
+class TestFilterObservationsByDeviceStatus:
+    """Test cases for filter_observations_by_device_status function"""
+
+    @staticmethod
+    def _observation(sensor_id, status, recorded_at="2023-01-01T10:00:00-05:00"):
+        return {'source': sensor_id, 'recorded_at': recorded_at, 'additional': {'status': status}}
+
+    async def test_filter_observations_by_device_status_fetches_off_states_once(self):
+        """Test that "Off" devices are looked up in one bulk call and repeated records are dropped"""
+        observations = [
+            self._observation("sensor1", "Off"),
+            self._observation("sensor2", "Moving"),
+            self._observation("sensor1", "Off"),
+            self._observation("sensor3", "Off", recorded_at="2023-01-01T11:00:00-05:00"),
+        ]
+        known_states = {"sensor3": {"recorded_at": "2023-01-01T11:00:00-05:00"}}
+
+        with patch('app.actions.utils.state_manager.get_states_bulk', return_value=known_states) as mock_get_states, \
+             patch('app.actions.utils.state_manager.set_states_bulk') as mock_set_states:
+            result = await filter_observations_by_device_status("test-integration-id", observations)
+
+        assert result == observations[:2]
+        mock_get_states.assert_called_once_with(
+            integration_id="test-integration-id",
+            action_id="quiet_period:off",
+            source_ids=["sensor1", "sensor3"]
+        )
+        # sensor3 re-reported its stored record, so only its TTL is refreshed
+        mock_set_states.assert_called_once_with(
+            integration_id="test-integration-id",
+            action_id="quiet_period:off",
+            states={"sensor1": {"recorded_at": "2023-01-01T10:00:00-05:00"}},
+            keep_source_ids=["sensor3"],
+            ex=600
+        )
+
+    async def test_filter_observations_by_device_status_missing_status(self):
+        """Test that a record with a null Galooli status is kept rather than failing the batch"""
+        observations = [self._observation("sensor1", None)]
+
+        with patch('app.actions.utils.state_manager.get_states_bulk', return_value={}) as mock_get_states, \
+             patch('app.actions.utils.state_manager.set_states_bulk') as mock_set_states:
+            result = await filter_observations_by_device_status("test-integration-id", observations)
+
+        assert result == observations
+        mock_get_states.assert_called_once_with(
+            integration_id="test-integration-id",
+            action_id="quiet_period:off",
+            source_ids=[]
+        )
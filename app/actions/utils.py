@@ -1,30 +1,97 @@
 import logging
-import dateparser
-import pytz
 
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from operator import itemgetter
+from typing import Optional, TypedDict
+from app.actions.client import GALOOLI_PROPERTIES
 from app.services.state import IntegrationStateManager
 
 logger = logging.getLogger(__name__)
 state_manager = IntegrationStateManager()
 
-
-def convert_to_gundi_observation(galooli_record, *, reports_timezone:pytz.FixedOffset, subject_type:str="vehicle"):
+# Picks the fields used in the observation from a DataSet row, by their position in the requested properties
+_GALOOLI_COLUMNS = {name: i for i, name in enumerate(GALOOLI_PROPERTIES)}
+_get_record_fields = itemgetter(
+    _GALOOLI_COLUMNS['unit_id'],
+    _GALOOLI_COLUMNS['unit_name'],
+    _GALOOLI_COLUMNS['organization_name'],
+    _GALOOLI_COLUMNS['real_time_GPS_Time'],
+    _GALOOLI_COLUMNS['real_time_status'],
+    _GALOOLI_COLUMNS['real_time_Latitude'],
+    _GALOOLI_COLUMNS['real_time_Longitude'],
+    _GALOOLI_COLUMNS['real_time_Distance'],
+    _GALOOLI_COLUMNS['real_time_Speed'],
+)
+
+
+# Shape of the observations sent to Gundi. The nesting is what the Gundi API expects, so it is kept as is.
+# Values are passed through with the JSON types Galooli sent, so e.g. a numeric unit_id arrives as an int, not a str.
+class GundiLocation(TypedDict):
+    lat: float
+    lon: float
+
+
+class GundiObservationAdditional(TypedDict):
+    sensor_id: str
+    org_name: str
+    status: str
+    distance: float
+    speed: float
+
+
+class GundiObservation(TypedDict):
+    source: str
+    source_name: str
+    subject_type: str
+    type: str
+    recorded_at: str
+    location: GundiLocation
+    additional: GundiObservationAdditional
+
+
+def parse_galooli_time(value: str) -> datetime:
+    # Galooli reports times (GPS time, MaxGmtUpdateTime) as "YYYY-MM-DD HH:MM:SS", optionally with fractional seconds.
+    # fromisoformat parses it in C, much faster than strptime for large pulls.
     try:
-        # Unpack the galooli record into its components
-        (sensor_id, subject_name, org_name, fixtime, status, latitude, longitude,
-         distance, speed) = galooli_record
-    except ValueError as e:
-        logger.exception(f"Failed to unpack Galooli record: {galooli_record}")
-        raise e
+        return datetime.fromisoformat(value)
+    except ValueError:
+        # Anything else goes through the lenient (and much slower) parser.
+        # It is imported here since loading it takes several hundred ms and the fast path rarely misses.
+        import dateparser
+        if (parsed := dateparser.parse(value)) is None:
+            raise
+        return parsed
+
+
+# Units reporting on the same poll interval share GPS times, so most rows of a pull hit the cache
+@lru_cache(maxsize=4096)
+def format_recorded_at(fixtime: str, reports_timezone: tzinfo) -> str:
+    return parse_galooli_time(fixtime).replace(tzinfo=reports_timezone).isoformat()
+
+
+@lru_cache(maxsize=64)
+def get_reports_timezone(offset_minutes: int) -> tzinfo:
+    return timezone(timedelta(minutes=offset_minutes))
+
+
+def convert_to_gundi_observation(galooli_record, *, reports_timezone: tzinfo, subject_type:str="vehicle") -> Optional[GundiObservation]:
+    # Reject short records up front rather than through the IndexError of the unpacking below
+    if len(galooli_record) < len(GALOOLI_PROPERTIES):
+        logger.error("Failed to unpack Galooli record: %s", galooli_record)
+        raise ValueError(f"Galooli record has fewer fields than requested: {galooli_record}")
+
+    # Unpack the galooli record into its components
+    (sensor_id, subject_name, org_name, fixtime, status, latitude, longitude,
+     distance, speed) = _get_record_fields(galooli_record)
 
     if latitude and longitude and fixtime and sensor_id:
-        localized_gps_time = reports_timezone.localize(dateparser.parse(fixtime))
-        obs = {
+        obs: GundiObservation = {
             'source': sensor_id,
             'source_name': subject_name,
             'subject_type': subject_type,
             'type': 'tracking-device',
-            'recorded_at': localized_gps_time.isoformat(),
+            'recorded_at': format_recorded_at(fixtime, reports_timezone),
             'location': {
                 'lat': latitude,
                 'lon': longitude
@@ -39,46 +106,70 @@ def convert_to_gundi_observation(galooli_record, *, reports_timezone:pytz.FixedO
         }
         return obs
     else:
-        logger.error(f'Got bad data from Galooli: mfg_id {sensor_id}, time {fixtime}, lat {latitude} long {longitude}, record: ({galooli_record})')
+        logger.error(
+            'Got bad data from Galooli: mfg_id %s, time %s, lat %s long %s, record: (%s)',
+            sensor_id, fixtime, latitude, longitude, galooli_record
+        )
 
 
-async def filter_observations_by_device_status(integration_id:str, observations:list[dict]):
+async def filter_observations_by_device_status(integration_id:str, observations:list[GundiObservation]) -> list[GundiObservation]:
     """
     Filters observations based on the device status.
     """
     if not observations:
         return []
 
-    filtered_observations = []
+    # If status is "Off", we check whether we've seen the record within the last 10 minutes.
+    # The states of all the "Off" devices in the batch are fetched at once.
+    status = "off"
+    cache_key = f"quiet_period:{status}"
+    off_sensor_ids = list(dict.fromkeys(
+        obs['source'] for obs in observations
+        if (obs['additional'].get('status') or '').lower() == status
+    ))
+    stored_states = await state_manager.get_states_bulk(
+        integration_id=integration_id,
+        action_id=cache_key,
+        source_ids=off_sensor_ids
+    )
+    device_states = dict(stored_states)
 
+    filtered_observations = []
     for obs in observations:
 
-        # If status is "Off", we check whether we've seen the record within the last 10 minutes.
-        status = obs['additional'].get('status', '').lower()
-
-        if status == "off":
+        if (obs['additional'].get('status') or '').lower() == status:
 
             recorded_at = obs['recorded_at']
-            cache_key = f"quiet_period:{status}"
-
             sensor_id = obs['source']
-            if device_state := await state_manager.get_state(
-                integration_id=integration_id,
-                action_id=cache_key,
-                source_id=sensor_id
-            ):
-                
+            if device_state := device_states.get(sensor_id):
+
                 # If the recorded_at has changed, then we want to send this observation.
                 if device_state.get('recorded_at') != recorded_at:
                     filtered_observations.append(obs)
             else:
                 filtered_observations.append(obs) # first time for this device+off status
 
-            # Set TTL on "Off" status 
-            await state_manager.set_state(integration_id=integration_id, action_id=cache_key, 
-                                        source_id=sensor_id, state={"recorded_at": recorded_at}, ex=600)
+            # Later records of the same device in this batch compare against this one
+            device_states[sensor_id] = {"recorded_at": recorded_at}
 
         else:
             filtered_observations.append(obs)
 
+    # Set TTL on "Off" status, keeping the latest record seen for each device, in one round trip.
+    # Devices re-reporting the stored record only get their TTL refreshed.
+    changed_states = {}
+    unchanged_sensor_ids = []
+    for sensor_id in off_sensor_ids:
+        if stored_states.get(sensor_id, {}).get('recorded_at') == device_states[sensor_id]['recorded_at']:
+            unchanged_sensor_ids.append(sensor_id)
+        else:
+            changed_states[sensor_id] = device_states[sensor_id]
+    await state_manager.set_states_bulk(
+        integration_id=integration_id,
+        action_id=cache_key,
+        states=changed_states,
+        keep_source_ids=unchanged_sensor_ids,
+        ex=600
+    )
+
     return filtered_observations
@@ -54,6 +54,14 @@ def async_return(result):
     return f
 
 
+@pytest.fixture(scope="session")
+def event_loop():
+    # One loop for the whole run instead of a new one per test
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
 @pytest.fixture
 def mock_integration_state():
     return {"last_execution": "2024-01-29T11:20:00+0200"}
@@ -67,6 +75,9 @@ def mock_redis(mocker, mock_integration_state):
     redis_client.get.return_value = async_return(
         json.dumps(mock_integration_state, default=str)
     )
+    redis_client.mget.return_value = async_return(
+        [json.dumps(mock_integration_state, default=str), None]
+    )
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -13,6 +13,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.services.action_runner import execute_action, _portal
 from app.services.self_registration import register_integration_in_gundi
+from app.actions.client import aclose_client
 
 
 # For running behind a proxy, we'll want to configure the root path for OpenAPI browser.
@@ -28,6 +29,7 @@ async def lifespan(app: FastAPI):
     yield
     # Shotdown Hook
     await _portal.close()
+    await aclose_client()
 
 
 app = FastAPI(
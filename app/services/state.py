@@ -20,6 +20,19 @@ class IntegrationStateManager:
         value = json.loads(json_value) if json_value else {}
         return value
 
+    async def get_states_bulk(self, integration_id: str, action_id: str, source_ids: list) -> dict:
+        """Fetches the state of several sources in a single round trip, keyed by source ID"""
+        if not source_ids:
+            return {}
+        keys = [f"integration_state.{integration_id}.{action_id}.{source_id}" for source_id in source_ids]
+        for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
+            with attempt:
+                json_values = await self.db_client.mget(keys)
+        return {
+            source_id: json.loads(json_value) if json_value else {}
+            for source_id, json_value in zip(source_ids, json_values)
+        }
+
     async def set_state(self, integration_id: str, action_id: str, state: dict, source_id: str = "no-source", **kwargs):
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
@@ -29,6 +42,26 @@ class IntegrationStateManager:
                     **kwargs
                 )
 
+    async def set_states_bulk(self, integration_id: str, action_id: str, states: dict, ex: int, keep_source_ids=()):
+        """
+        Writes the states of several sources in a single pipelined round trip, expiring in ex seconds.
+        Sources in keep_source_ids already hold the right value and only get their TTL reset.
+        """
+        if not states and not keep_source_ids:
+            return
+        for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
+            with attempt:
+                async with self.db_client.pipeline(transaction=False) as pipe:
+                    for source_id, state in states.items():
+                        pipe.set(
+                            f"integration_state.{integration_id}.{action_id}.{source_id}",
+                            json.dumps(state, default=str),
+                            ex=ex
+                        )
+                    for source_id in keep_source_ids:
+                        pipe.expire(f"integration_state.{integration_id}.{action_id}.{source_id}", ex)
+                    await pipe.execute()
+
     async def delete_state(self, integration_id: str, action_id: str, source_id: str = "no-source"):
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
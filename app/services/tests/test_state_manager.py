@@ -44,6 +44,52 @@ async def test_get_integration_state(mocker, mock_redis, integration_v2, mock_in
     )
 
 
+@pytest.mark.asyncio
+async def test_get_integration_states_bulk(mocker, mock_redis, integration_v2, mock_integration_state):
+    mocker.patch("app.services.state.redis", mock_redis)
+    state_manager = IntegrationStateManager()
+    integration_id = str(integration_v2.id)
+
+    states = await state_manager.get_states_bulk(
+        integration_id=integration_id,
+        action_id="pull_observations",
+        source_ids=["device-1", "device-2"]
+    )
+
+    assert states == {"device-1": mock_integration_state, "device-2": {}}
+    mock_redis.Redis.return_value.mget.assert_called_once_with([
+        f"integration_state.{integration_id}.pull_observations.device-1",
+        f"integration_state.{integration_id}.pull_observations.device-2",
+    ])
+
+
+@pytest.mark.asyncio
+async def test_set_integration_states_bulk(mocker, mock_redis, integration_v2):
+    mocker.patch("app.services.state.redis", mock_redis)
+    state_manager = IntegrationStateManager()
+    integration_id = str(integration_v2.id)
+
+    await state_manager.set_states_bulk(
+        integration_id=integration_id,
+        action_id="pull_observations",
+        states={"device-1": {"recorded_at": "2024-01-29T11:20:00+02:00"}},
+        keep_source_ids=["device-2"],
+        ex=600
+    )
+
+    pipeline = mock_redis.Redis.return_value
+    pipeline.set.assert_called_once_with(
+        f"integration_state.{integration_id}.pull_observations.device-1",
+        '{"recorded_at": "2024-01-29T11:20:00+02:00"}',
+        ex=600
+    )
+    pipeline.expire.assert_called_once_with(
+        f"integration_state.{integration_id}.pull_observations.device-2",
+        600
+    )
+    pipeline.execute.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_delete_integration_state(mocker, mock_redis, integration_v2):
     mocker.patch("app.services.state.redis", mock_redis)
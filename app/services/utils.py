@@ -1,3 +1,4 @@
+import itertools
 import struct
 import typing
 from pydantic import create_model, BaseModel
@@ -399,6 +400,8 @@ class OptionalStringType(str):
 
 
 def generate_batches(iterable, batch_size):
-    for i in range(0, len(iterable), batch_size):
-        yield iterable[i: i + batch_size]
+    # Works with any iterable (including generators), yielding lists of up to batch_size items
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
 